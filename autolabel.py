@@ -1,26 +1,39 @@
 import psycopg2
+from psycopg2.extras import execute_values
 import requests
 import logging
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import re
+import os
+
+import config
+import plcindex
+import retryqueue
+from sharding import parse_shard_args, shard_query, claim_review, release_subject, log_progress, run_sharded
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Database configuration
-DB_NAME = "ozone"
-DB_USER = "postgres"
-DB_PASSWORD = "foo"
-DB_HOST = "localhost"
-DB_PORT = 5432
+DB_NAME = config.get("DB_NAME", "ozone")
+DB_USER = config.get("DB_USER", "postgres")
+DB_PASSWORD = config.get("DB_PASSWORD", "foo")
+DB_HOST = config.get("DB_HOST", "localhost")
+DB_PORT = config.get("DB_PORT", 5432)
 
 # API configuration
-API_URL = "https://bsky.social/xrpc"
-ADMIN_USERNAME = "foo"
-ADMIN_PASSWORD = "foo"
-LABEL = "foo"
-KEYWORD_PATTERN = re.compile(r"keyword", re.IGNORECASE)  # Case-insensitive regex for "keyword"
-LABELER_DID = "foo"
+API_URL = config.get("API_URL", "https://bsky.social/xrpc")
+ADMIN_USERNAME = config.get("ADMIN_USERNAME", "foo")
+ADMIN_PASSWORD = config.get("ADMIN_PASSWORD", "foo")
+LABEL = config.get("LABEL", "foo")
+KEYWORD_PATTERN = re.compile(config.get("KEYWORD_PATTERN", r"keyword"), re.IGNORECASE)  # Case-insensitive regex for "keyword"
+LABELER_DID = config.get("LABELER_DID", "foo")
+
+# Post (record) subject configuration
+POST_COLLECTION = "app.bsky.feed.post"
+GET_POSTS_BATCH = 25  # Maximum URIs per app.bsky.feed.getPosts call
+POST_FETCH_CONCURRENCY = config.get("POST_FETCH_CONCURRENCY", 4)
 
 
 def get_access_token(api_url, username, password):
@@ -42,8 +55,8 @@ def get_access_token(api_url, username, password):
         exit(1)
 
 
-def fetch_open_reviews():
-    """Fetch records with 'reviewOpen' state from the moderation_subject_status table."""
+def fetch_open_reviews(shard=0, shards=1):
+    """Fetch records with 'reviewOpen' state from the moderation_subject_status table, optionally for one shard."""
     records = []
     try:
         logging.info("Connecting to the PostgreSQL database...")
@@ -57,18 +70,20 @@ def fetch_open_reviews():
         cursor = conn.cursor()
 
         query = """
-        SELECT id, did, "reviewState", comment
+        SELECT id, did, "recordPath", "reviewState", comment
         FROM moderation_subject_status
         WHERE "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
         """
-        cursor.execute(query)
+        query, params = shard_query(query, shard, shards)
+        cursor.execute(query, params)
         results = cursor.fetchall()
 
         for row in results:
-            record_id, did, review_state, comment = row
+            record_id, did, record_path, review_state, comment = row
             records.append({
                 "id": record_id,
                 "did": did,
+                "recordPath": record_path or "",
                 "reviewState": review_state,
                 "comment": comment
             })
@@ -82,26 +97,55 @@ def fetch_open_reviews():
     return records
 
 
-def fetch_username_from_did(api_url, access_token, did):
-    """Fetch the username (handle) associated with a DID using the Bluesky API."""
+def request_username(api_url, access_token, did):
+    """Fetch the username (handle) associated with a DID using the Bluesky API, raising on failure."""
     headers = {"Authorization": f"Bearer {access_token}"}
+    response = requests.get(f"{api_url}/app.bsky.actor.getProfile", headers=headers, params={"actor": did})
+    if response.status_code != 200:
+        raise requests.HTTPError(f"{response.status_code} - {response.text}", response=response)
+    return response.json().get("handle")
+
+
+def fetch_username_from_did(api_url, access_token, did):
+    """Fetch the username (handle) associated with a DID, queueing the subject for retry on failure."""
     try:
-        response = requests.get(f"{api_url}/app.bsky.actor.getProfile", headers=headers, params={"actor": did})
-        if response.status_code == 200:
-            return response.json().get("handle")
-        else:
-            logging.error(f"Failed to fetch username for DID {did}: {response.status_code} - {response.text}")
-            return None
+        username = request_username(api_url, access_token, did)
     except Exception as e:
-        logging.error(f"Error fetching username for DID {did}: {e}")
+        logging.error(f"Failed to fetch username for DID {did}: {e}")
+        retryqueue.record_failure("autolabel.label_subject", {"did": did}, e)
         return None
+    retryqueue.resolve("autolabel.label_subject", {"did": did})
+    return username
 
 
-def apply_label_to_did(conn, did, label):
-    """Apply the specified label to a given DID."""
+def open_handle_index():
+    """Open the offline PLC handle index if one has been built, otherwise return None."""
+    if not os.path.exists(plcindex.PLC_INDEX_PATH):
+        return None
     try:
-        cursor = conn.cursor()
+        return plcindex.open_index(plcindex.PLC_INDEX_PATH)
+    except Exception as e:
+        logging.error(f"Failed to open PLC handle index {plcindex.PLC_INDEX_PATH}: {e}")
+        return None
+
+
+def resolve_handle(api_url, access_token, did, index=None):
+    """Resolve a DID's handle from the offline index first, falling back to the API on a miss or stale entry."""
+    if index is not None:
+        handle = plcindex.lookup_handle(index, did)
+        if handle:
+            return handle
+
+    handle = fetch_username_from_did(api_url, access_token, did)
+    if handle and index is not None:
+        plcindex.store_handle(index, did, handle)
+    return handle
 
+
+def label_did(conn, did, label):
+    """Apply the specified label to a given DID, raising on failure. Returns False if it already existed."""
+    cursor = conn.cursor()
+    try:
         # Check if the label already exists
         uri = did
         check_query = """
@@ -110,10 +154,8 @@ def apply_label_to_did(conn, did, label):
         WHERE "src" = %s AND "uri" = %s AND "val" = %s;
         """
         cursor.execute(check_query, (LABELER_DID, uri, label))
-        exists = cursor.fetchone() is not None
-        if exists:
-            logging.info(f"Label '{label}' already exists for DID {did}. Skipping.")
-            return
+        if cursor.fetchone() is not None:
+            return False
 
         # Apply the label
         resolved_at = datetime.utcnow().isoformat()
@@ -125,16 +167,180 @@ def apply_label_to_did(conn, did, label):
         cid = ""  # Replace with actual CID if available
         cursor.execute(insert_query, (LABELER_DID, uri, cid, label, False, resolved_at))
         conn.commit()
+        return True
+    finally:
+        cursor.close()
+
 
-        logging.info(f"Label '{label}' applied to DID {did}.")
+def apply_label_to_did(conn, did, label):
+    """Apply the specified label to a given DID, queueing it for retry on failure."""
+    try:
+        if label_did(conn, did, label):
+            logging.info(f"Label '{label}' applied to DID {did}.")
+        else:
+            logging.info(f"Label '{label}' already exists for DID {did}. Skipping.")
+        retryqueue.resolve("autolabel.apply_label", {"did": did, "label": label})
     except Exception as e:
         logging.error(f"Failed to apply label to DID {did}: {e}")
+        retryqueue.record_failure("autolabel.apply_label", {"did": did, "label": label}, e)
+        retryqueue.rollback_quietly(conn)
+
+
+def is_post_review(review):
+    """Check whether a review's subject is a post record rather than an account."""
+    return review.get("recordPath", "").startswith(f"{POST_COLLECTION}/")
+
+
+def request_posts(api_url, access_token, uris):
+    """Fetch the CID and text of up to GET_POSTS_BATCH posts with a single getPosts call, raising on failure."""
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = requests.get(f"{api_url}/app.bsky.feed.getPosts", headers=headers, params={"uris": uris})
+    if response.status_code != 200:
+        raise requests.HTTPError(f"{response.status_code} - {response.text}", response=response)
+    return {
+        post["uri"]: {"cid": post.get("cid", ""), "text": post.get("record", {}).get("text", "")}
+        for post in response.json().get("posts", [])
+    }
+
+
+def fetch_posts(api_url, access_token, uris):
+    """Fetch one batch of posts. Returns (posts, error), with error set instead of raising on failure."""
+    try:
+        return request_posts(api_url, access_token, uris), None
+    except Exception as e:
+        logging.error(f"Failed to fetch {len(uris)} posts: {e}")
+        return {}, e
+
+
+def fetch_post_texts(api_url, access_token, uris):
+    """Fetch posts in GET_POSTS_BATCH-sized batches, with at most POST_FETCH_CONCURRENCY requests in flight.
+
+    Returns the fetched posts, the batches that were fetched, and a list of (uris, error) for the ones that failed.
+    """
+    batches = [uris[i:i + GET_POSTS_BATCH] for i in range(0, len(uris), GET_POSTS_BATCH)]
+    posts = {}
+    fetched = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=POST_FETCH_CONCURRENCY) as executor:
+        results = executor.map(lambda batch: fetch_posts(api_url, access_token, batch), batches)
+        for batch, (batch_posts, error) in zip(batches, results):
+            posts.update(batch_posts)
+            if error is not None:
+                failed.append((batch, error))
+            else:
+                fetched.append(batch)
+    logging.info(f"Fetched {len(posts)} of {len(uris)} posts in {len(batches)} getPosts calls.")
+    return posts, fetched, failed
+
+
+def post_uri(review):
+    """Build the AT URI of a post review's subject."""
+    return f"at://{review['did']}/{review['recordPath']}"
+
+
+def retry_payload(reviews):
+    """Keep only the review fields needed to replay a post sweep."""
+    return {"reviews": [{"id": r["id"], "did": r["did"], "recordPath": r["recordPath"]} for r in reviews]}
+
+
+def label_posts(conn, reviews, posts):
+    """Label the given posts by URI and close their reviews in one transaction, raising on failure.
+
+    Reviews another worker holds or has already closed are skipped. Returns (labels applied, reviews closed).
+    """
+    uris = {review["id"]: post_uri(review) for review in reviews}
+    cursor = conn.cursor()
+    try:
+        # Claim the reviews that are still open; rows another worker is writing are left to it
+        claim_query = """
+        SELECT id
+        FROM moderation_subject_status
+        WHERE id = ANY(%s) AND "reviewState" = 'tools.ozone.moderation.defs#reviewOpen'
+        FOR UPDATE SKIP LOCKED;
+        """
+        cursor.execute(claim_query, (list(uris),))
+        claimed = [row[0] for row in cursor.fetchall()]
+        claimed_uris = sorted({uris[record_id] for record_id in claimed})
+
+        existing_query = """
+        SELECT "uri"
+        FROM label
+        WHERE "src" = %s AND "val" = %s AND "uri" = ANY(%s);
+        """
+        cursor.execute(existing_query, (LABELER_DID, LABEL, claimed_uris))
+        labelled = {row[0] for row in cursor.fetchall()}
+
+        resolved_at = datetime.utcnow().isoformat()
+        insert_query = """
+        INSERT INTO label ("src", "uri", "cid", "val", "neg", "cts")
+        VALUES %s
+        ON CONFLICT DO NOTHING;
+        """
+        rows = [
+            (LABELER_DID, uri, posts[uri]["cid"], LABEL, False, resolved_at)
+            for uri in claimed_uris if uri not in labelled
+        ]
+        execute_values(cursor, insert_query, rows)
+
+        update_query = """
+        UPDATE moderation_subject_status
+        SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
+            "lastReviewedAt" = %s,
+            "updatedAt" = %s
+        WHERE id = ANY(%s);
+        """
+        cursor.execute(update_query, (resolved_at, resolved_at, claimed))
+        conn.commit()
+        return len(rows), len(claimed)
     finally:
         cursor.close()
 
 
-def process_reviews(reviews, access_token):
-    """Process each open review."""
+def matching_post_reviews(reviews, posts):
+    """Return the reviews whose post text matches the keyword pattern."""
+    return [
+        review for review in reviews
+        if post_uri(review) in posts and KEYWORD_PATTERN.search(posts[post_uri(review)]["text"])
+    ]
+
+
+def process_post_reviews(conn, access_token, reviews):
+    """Label matching posts by URI and close their reviews with batched writes, queueing failures for retry.
+
+    Returns the reviews that were checked and did not match, i.e. the ones left for a moderator.
+    """
+    posts, fetched, failed = fetch_post_texts(API_URL, access_token, sorted({post_uri(review) for review in reviews}))
+    for batch in fetched:
+        batch = set(batch)
+        retryqueue.resolve("autolabel.label_posts", retry_payload([r for r in reviews if post_uri(r) in batch]))
+    retried = set()
+    for batch, error in failed:
+        batch = set(batch)
+        retried |= batch
+        retryqueue.record_failure(
+            "autolabel.label_posts", retry_payload([r for r in reviews if post_uri(r) in batch]), error
+        )
+
+    matches = matching_post_reviews(reviews, posts)
+    logging.info(f"{len(matches)} of {len(reviews)} post reviews match the keyword pattern.")
+    matched = {review["id"] for review in matches}
+    unmatched = [r for r in reviews if r["id"] not in matched and post_uri(r) not in retried]
+    if not matches:
+        return unmatched
+
+    try:
+        applied, closed = label_posts(conn, matches, posts)
+        logging.info(f"Label '{LABEL}' applied to {applied} posts; closed {closed} post reviews.")
+        retryqueue.resolve("autolabel.label_posts", retry_payload(matches))
+    except Exception as e:
+        logging.error(f"Failed to label matching posts: {e}")
+        retryqueue.record_failure("autolabel.label_posts", retry_payload(matches), e)
+        retryqueue.rollback_quietly(conn)
+    return unmatched
+
+
+def process_reviews(reviews, access_token, shard=0, shards=1):
+    """Process each open review, skipping subjects another worker has claimed."""
     try:
         conn = psycopg2.connect(
             dbname=DB_NAME,
@@ -143,7 +349,16 @@ def process_reviews(reviews, access_token):
             host=DB_HOST,
             port=DB_PORT
         )
-        for review in reviews:
+        index = open_handle_index()
+
+        # Post subjects are matched on their text in batches; accounts are matched on their handle below
+        post_reviews = [review for review in reviews if is_post_review(review)]
+        reviews = [review for review in reviews if not is_post_review(review)]
+        if post_reviews:
+            process_post_reviews(conn, access_token, post_reviews)
+
+        for done, review in enumerate(reviews, start=1):
+            log_progress(shard, shards, done - 1, len(reviews))
             record_id = review.get("id")
             did = review.get("did")
             comment = review.get("comment")
@@ -152,45 +367,180 @@ def process_reviews(reviews, access_token):
                 logging.warning(f"Skipping review with missing ID or DID: {review}")
                 continue
 
-            # Fetch the username for the DID
-            username = fetch_username_from_did(API_URL, access_token, did)
-
-            # Check if the username matches the keyword pattern
-            if username and KEYWORD_PATTERN.search(username):
-                logging.debug(f"Username '{username}' matches pattern. Applying label and closing review...")
-                apply_label_to_did(conn, did, LABEL)
-
-                # Mark review as closed
-                resolved_at = datetime.utcnow().isoformat()
-                update_query = """
-                UPDATE moderation_subject_status
-                SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
-                    "lastReviewedAt" = %s,
-                    "updatedAt" = %s
-                WHERE id = %s;
-                """
-                cursor = conn.cursor()
-                cursor.execute(update_query, (resolved_at, resolved_at, record_id))
-                conn.commit()
-                cursor.close()
-                logging.info(f"Review for record ID {record_id} marked as closed.")
-            else:
-                logging.debug(f"Username '{username}' does not match pattern. Skipping review ID {record_id}.")
+            if not claim_review(conn, record_id, did):
+                continue
+
+            try:
+                process_review(conn, access_token, record_id, did, index)
+            finally:
+                release_subject(conn, did)
+
+        log_progress(shard, shards, len(reviews), len(reviews), force=True)
+        if index is not None:
+            index.close()
         conn.close()
     except Exception as e:
         logging.error(f"Error processing reviews: {e}")
 
 
-def main():
+def mark_review_closed(conn, record_id):
+    """Close a review that is still open, raising on failure. A replay must not close an escalated review."""
+    resolved_at = datetime.utcnow().isoformat()
+    update_query = """
+    UPDATE moderation_subject_status
+    SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
+        "lastReviewedAt" = %s,
+        "updatedAt" = %s
+    WHERE id = %s AND "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(update_query, (resolved_at, resolved_at, record_id))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def process_review(conn, access_token, record_id, did, index=None):
+    """Label the DID and close the review if its username matches the keyword pattern."""
+    # Fetch the username for the DID
+    username = resolve_handle(API_URL, access_token, did, index)
+
+    # Check if the username matches the keyword pattern
+    if username and KEYWORD_PATTERN.search(username):
+        logging.debug(f"Username '{username}' matches pattern. Applying label and closing review...")
+        apply_label_to_did(conn, did, LABEL)
+
+        # Mark review as closed
+        try:
+            mark_review_closed(conn, record_id)
+            logging.info(f"Review for record ID {record_id} marked as closed.")
+            retryqueue.resolve("autolabel.close_review", {"id": record_id})
+        except Exception as e:
+            logging.error(f"Failed to close review with record ID {record_id}: {e}")
+            retryqueue.record_failure("autolabel.close_review", {"id": record_id}, e)
+            retryqueue.rollback_quietly(conn)
+    else:
+        logging.debug(f"Username '{username}' does not match pattern. Skipping review ID {record_id}.")
+
+
+_retry_token = None
+
+
+def retry_access_token():
+    """Log in once per replay run and reuse the token for every retried operation."""
+    global _retry_token
+    if _retry_token is None:
+        _retry_token = get_access_token(API_URL, ADMIN_USERNAME, ADMIN_PASSWORD)
+    return _retry_token
+
+
+def retry_label_subject(payload):
+    """Replay a failed handle lookup: label the DID and close its open account reviews on a match."""
+    did = payload["did"]
+    username = request_username(API_URL, retry_access_token(), did)
+    if not username or not KEYWORD_PATTERN.search(username):
+        logging.debug(f"Username '{username}' does not match pattern. Nothing to retry for DID {did}.")
+        return
+
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        label_did(conn, did, LABEL)
+        resolved_at = datetime.utcnow().isoformat()
+        update_query = """
+        UPDATE moderation_subject_status
+        SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
+            "lastReviewedAt" = %s,
+            "updatedAt" = %s
+        WHERE did = %s AND "recordPath" = '' AND "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
+        """
+        cursor = conn.cursor()
+        cursor.execute(update_query, (resolved_at, resolved_at, did))
+        conn.commit()
+        cursor.close()
+        logging.info(f"Retried DID {did}: label '{LABEL}' applied and open reviews closed.")
+    finally:
+        conn.close()
+
+
+def retry_apply_label(payload):
+    """Replay a failed label insert."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        label_did(conn, payload["did"], payload["label"])
+    finally:
+        conn.close()
+
+
+def retry_close_review(payload):
+    """Replay a failed review closure."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        mark_review_closed(conn, payload["id"])
+    finally:
+        conn.close()
+
+
+def retry_label_posts(payload):
+    """Replay a failed post sweep: refetch the posts, then label and close the ones that match."""
+    reviews = payload["reviews"]
+    uris = sorted({post_uri(review) for review in reviews})
+    posts = {}
+    for i in range(0, len(uris), GET_POSTS_BATCH):
+        posts.update(request_posts(API_URL, retry_access_token(), uris[i:i + GET_POSTS_BATCH]))
+
+    matches = matching_post_reviews(reviews, posts)
+    if not matches:
+        return
+
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        applied, closed = label_posts(conn, matches, posts)
+        logging.info(f"Retried post sweep: label '{LABEL}' applied to {applied} posts; closed {closed} reviews.")
+    finally:
+        conn.close()
+
+
+def run_shard(shard, shards):
+    """Log in, then fetch and process the open reviews belonging to one shard."""
     # Step 1: Log into Ozone and get the access token
     access_token = get_access_token(API_URL, ADMIN_USERNAME, ADMIN_PASSWORD)
 
     # Step 2: Fetch open reviews from the database
-    reviews = fetch_open_reviews()
+    reviews = fetch_open_reviews(shard, shards)
 
     # Step 3: Process each review
     logging.info("Processing open reviews...")
-    process_reviews(reviews, access_token)
+    process_reviews(reviews, access_token, shard, shards)
+
+
+def main(argv=None):
+    args = parse_shard_args(argv, "Auto-label accounts whose handle matches KEYWORD_PATTERN.")
+    run_sharded(run_shard, args)
 
     logging.info("Review processing completed.")
 
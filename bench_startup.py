@@ -0,0 +1,55 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import ozone
+
+# Each probe runs in a fresh interpreter: the bare interpreter, the CLI itself, then every subcommand's imports
+BASELINE_PROBES = {
+    "python": "pass",
+    "ozone": "import ozone",
+}
+COMMAND_PROBE = "import ozone; ozone.load_command({name!r})"
+
+
+def measure(code, cwd):
+    """Run code in a cold interpreter. Returns (wall seconds, peak RSS in MiB, exit status)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return elapsed, rss, process.returncode
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start latency and peak RSS for each subcommand.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per probe; the median is reported.")
+    parser.add_argument("commands", nargs="*", default=list(ozone.COMMANDS), help="Subcommands to measure.")
+    args = parser.parse_args(argv)
+
+    probes = dict(BASELINE_PROBES)
+    probes.update({name: COMMAND_PROBE.format(name=name) for name in args.commands})
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"{'probe':<18}{'median ms':>12}{'min ms':>10}{'RSS MiB':>10}  status")
+    for name, code in probes.items():
+        runs = [measure(code, cwd) for _ in range(args.repeat)]
+        times = [elapsed * 1000 for elapsed, _, _ in runs]
+        rss = statistics.median(r for _, r, _ in runs)
+        failed = any(code != 0 for _, _, code in runs)
+        print(
+            f"{name:<18}{statistics.median(times):>12.1f}{min(times):>10.1f}{rss:>10.1f}  "
+            f"{'import failed' if failed else 'ok'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import logging
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Signup histogram resolution and sliding window size
+BIN_SECONDS = 3600
+WINDOW_BINS = 6
+
+# Thresholds for reporting a window as a burst and an account as a follow-ratio outlier
+MIN_BURST_SCORE = 5.0
+MIN_RATIO_SCORE = 3.5
+
+# Signups before the network existed or in the future are sentinels (e.g. 0001-01-01) and are dropped
+# first; of the rest, those outside the 1st-99th percentile range, widened by that range on each side,
+# are left out too, so a few stray dates cannot stretch the histogram over millions of empty bins
+EARLIEST_SIGNUP = np.datetime64("2022-01-01", "s")
+CLIP_PERCENTILE = 1.0
+
+# The shape the AppView returns createdAt in: UTC, optionally with fractional seconds
+UTC_TIMESTAMP = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?Z")
+
+
+def parse_created_at(value):
+    """Parse an ISO 8601 timestamp into UTC seconds; missing or malformed values become NaT."""
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError):
+        return np.datetime64("NaT", "s")
+    return np.datetime64(parsed, "s")
+
+
+def load_created_at(values):
+    """Parse createdAt values into UTC seconds; missing or malformed values become NaT.
+
+    Values in the common UTC shape are truncated to whole seconds and parsed by numpy in one call, which
+    keeps 100k accounts fast; offsets and anything unusual fall back to parse_created_at one by one.
+    """
+    common = np.array([isinstance(v, str) and UTC_TIMESTAMP.fullmatch(v) is not None for v in values], dtype=bool)
+    created = np.full(len(values), np.datetime64("NaT", "s"))
+    if common.any():
+        try:
+            created[common] = np.array([v[:19] for v, c in zip(values, common) if c], dtype="datetime64[s]")
+        except ValueError:
+            # A well-shaped but impossible date (e.g. month 13) sends the whole column down the slow path
+            common[:] = False
+    for i in np.flatnonzero(~common):
+        created[i] = parse_created_at(values[i])
+    return created
+
+
+def load_accounts(results):
+    """Load hydrated snoop results into columnar arrays."""
+    created = load_created_at([r.get("createdAt") for r in results])
+    return {
+        "did": np.array([r.get("did") for r in results], dtype=object),
+        "handle": np.array([r.get("handle") for r in results], dtype=object),
+        "createdAt": created,
+        "followersCount": np.array([r.get("followersCount") or 0 for r in results], dtype=np.float64),
+        "followsCount": np.array([r.get("followsCount") or 0 for r in results], dtype=np.float64),
+    }
+
+
+def signup_histogram(created, bin_seconds=BIN_SECONDS):
+    """Count signups per time bin. Returns (bin start times, counts, bin index of each account).
+
+    Accounts without a usable signup time (missing, before EARLIEST_SIGNUP, in the future, or far outside
+    the bulk of signups) get bin -1.
+    """
+    latest = np.datetime64("now", "s") + np.timedelta64(1, "D")
+    valid = ~np.isnat(created) & (created >= EARLIEST_SIGNUP) & (created <= latest)
+    bins = np.full(len(created), -1, dtype=np.int64)
+    if valid.any():
+        seconds = created.astype(np.int64)
+        low, high = np.percentile(seconds[valid], [CLIP_PERCENTILE, 100 - CLIP_PERCENTILE])
+        spread = max(high - low, bin_seconds)
+        valid &= (seconds >= low - spread) & (seconds <= high + spread)
+    if not valid.any():
+        return np.array([], dtype="datetime64[s]"), np.array([], dtype=np.int64), bins
+
+    seconds = created[valid].astype(np.int64)
+    start = seconds.min() - seconds.min() % bin_seconds
+    bins[valid] = (seconds - start) // bin_seconds
+    counts = np.bincount(bins[valid])
+    starts = (start + np.arange(len(counts)) * bin_seconds).astype("datetime64[s]")
+    return starts, counts, bins
+
+
+def burst_scores(counts, window_bins=WINDOW_BINS):
+    """Score every sliding window of signups against the Poisson rate expected over the whole range.
+
+    Returns (window counts, expected count per window, z-scores), indexed by the window's first bin.
+    """
+    window_bins = max(1, min(window_bins, len(counts)))
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    windows = cumulative[window_bins:] - cumulative[:-window_bins]
+    expected = max(counts.sum() * window_bins / len(counts), 1.0)
+    scores = (windows - expected) / np.sqrt(expected)
+    return windows, expected, scores
+
+
+def ratio_scores(follows, followers):
+    """Robust z-score of each account's log follow/follower ratio (median and MAD based, mean deviation if MAD is 0)."""
+    ratio = np.log1p(follows) - np.log1p(followers)
+    deviation = ratio - np.median(ratio)
+    scale = np.median(np.abs(deviation)) * 1.4826
+    if scale == 0:
+        # More than half the accounts share one ratio; scale by the mean absolute deviation instead
+        scale = np.mean(np.abs(deviation)) * 1.2533
+    if scale == 0:
+        return np.zeros_like(ratio)
+    return deviation / scale
+
+
+def detect_bursts(results, bin_seconds=BIN_SECONDS, window_bins=WINDOW_BINS, top=10):
+    """Rank suspicious account-creation bursts and follow-ratio outliers in snoop results."""
+    report = {"accounts": len(results), "bursts": [], "ratioOutliers": []}
+    if not results:
+        return report
+
+    accounts = load_accounts(results)
+    starts, counts, bins = signup_histogram(accounts["createdAt"], bin_seconds)
+    ratios = ratio_scores(accounts["followsCount"], accounts["followersCount"])
+    outliers = np.abs(ratios) >= MIN_RATIO_SCORE
+
+    if len(counts):
+        windows, expected, scores = burst_scores(counts, window_bins)
+        span = min(window_bins, len(counts))
+        taken = np.zeros(len(counts), dtype=bool)
+
+        # Greedily keep the highest-scoring windows that do not overlap an already reported burst
+        for first in np.argsort(-scores):
+            if scores[first] < MIN_BURST_SCORE or len(report["bursts"]) >= top:
+                break
+            if taken[first:first + span].any():
+                continue
+            taken[first:first + span] = True
+
+            members = np.flatnonzero((bins >= first) & (bins < first + span))
+            report["bursts"].append({
+                "start": str(starts[first]),
+                "end": str(starts[first] + np.timedelta64(span * bin_seconds, "s")),
+                "signups": int(windows[first]),
+                "expected": round(float(expected), 2),
+                "score": round(float(scores[first]), 2),
+                "ratioOutliers": int(outliers[members].sum()),
+                "dids": accounts["did"][members].tolist(),
+            })
+
+    for i in np.flatnonzero(outliers)[np.argsort(-np.abs(ratios[outliers]))][:top]:
+        report["ratioOutliers"].append({
+            "did": accounts["did"][i],
+            "handle": accounts["handle"][i],
+            "followsCount": int(accounts["followsCount"][i]),
+            "followersCount": int(accounts["followersCount"][i]),
+            "score": round(float(ratios[i]), 2),
+        })
+
+    return report
+
+
+def log_report(report):
+    """Log a burst report in place of the raw per-account rows."""
+    logging.info(f"Analysed {report['accounts']} accounts: {len(report['bursts'])} suspicious creation bursts.")
+    for rank, burst in enumerate(report["bursts"], start=1):
+        logging.info(
+            f"#{rank} {burst['start']} to {burst['end']}: {burst['signups']} signups "
+            f"(expected {burst['expected']}, score {burst['score']}), {burst['ratioOutliers']} ratio outliers"
+        )
+        logging.info(f"    DIDs: {', '.join(burst['dids'])}")
+
+    if report["ratioOutliers"]:
+        logging.info("Follow/follower ratio outliers:")
+    for account in report["ratioOutliers"]:
+        logging.info(
+            f"DID: {account['did']}, Handle: {account['handle']}, Following: {account['followsCount']}, "
+            f"Followers: {account['followersCount']}, Score: {account['score']}"
+        )
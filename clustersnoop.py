@@ -0,0 +1,196 @@
+import argparse
+import csv
+import json
+import logging
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+import mutualsnoop
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def load_seeds(path):
+    """Read seed DIDs from a file, one per line, ignoring blanks, comments and duplicates."""
+    seeds = []
+    with open(path) as f:
+        for line in f:
+            did = line.strip()
+            if did and not did.startswith("#") and did not in seeds:
+                seeds.append(did)
+    logging.info(f"Loaded {len(seeds)} seed DIDs from {path}.")
+    return seeds
+
+
+def fetch_edges(seeds):
+    """Fetch the follows and followers of every seed exactly once."""
+    edges = {}
+    for count, did in enumerate(seeds, start=1):
+        logging.info(f"Fetching edges for seed {count}/{len(seeds)}: {did}")
+        edges[did] = (mutualsnoop.fetch_follows(did), mutualsnoop.fetch_followers(did))
+    return edges
+
+
+def build_graph(seeds, edges):
+    """Build the sparse follow matrix (row follows column) and the symmetric mutual matrix."""
+    nodes = list(seeds)
+    index = {did: i for i, did in enumerate(nodes)}
+    rows, cols = [], []
+
+    for did, (follows, followers) in edges.items():
+        source = index[did]
+        for account in follows:
+            target = index.setdefault(account, len(nodes))
+            if target == len(nodes):
+                nodes.append(account)
+            rows.append(source)
+            cols.append(target)
+        for account in followers:
+            target = index.setdefault(account, len(nodes))
+            if target == len(nodes):
+                nodes.append(account)
+            rows.append(target)
+            cols.append(source)
+
+    size = len(nodes)
+    follows = sparse.coo_matrix(
+        (np.ones(len(rows), dtype=np.int8), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+        shape=(size, size),
+    ).tocsr()
+    # Duplicate edges (a seed following another seed is seen from both sides) sum to 2
+    follows.data[:] = 1
+    mutual = follows.multiply(follows.T).tocsr()
+    mutual = (mutual - sparse.diags(mutual.diagonal(), dtype=mutual.dtype)).tocsr()
+    mutual.eliminate_zeros()
+
+    logging.info(f"Built graph with {size} accounts, {follows.nnz} follow edges and {mutual.nnz // 2} mutual pairs.")
+    return nodes, follows, mutual
+
+
+def seed_overlap(nodes, mutual, seed_count):
+    """Score every pair of seeds by the mutual connections they share (count and Jaccard)."""
+    seed_rows = mutual[:seed_count].astype(np.int32)
+    shared = sparse.triu(seed_rows @ seed_rows.T, k=1).tocoo()
+    degree = np.asarray(seed_rows.sum(axis=1)).ravel()
+    direct = np.asarray(mutual[shared.row, shared.col]).ravel()
+
+    union = degree[shared.row] + degree[shared.col] - shared.data
+    jaccard = np.divide(shared.data, union, out=np.zeros(len(union), dtype=float), where=union > 0)
+
+    order = np.lexsort((-shared.data, -jaccard))
+    return [
+        {
+            "seed1": nodes[shared.row[i]],
+            "seed2": nodes[shared.col[i]],
+            "sharedMutuals": int(shared.data[i]),
+            "jaccard": round(float(jaccard[i]), 4),
+            "directMutual": bool(direct[i]),
+        }
+        for i in order
+    ]
+
+
+def core_numbers(mutual):
+    """Compute the k-core number of every account by repeated vectorized degree pruning."""
+    size = mutual.shape[0]
+    core = np.zeros(size, dtype=np.int32)
+    alive = np.ones(size, dtype=bool)
+    k = 1
+
+    while alive.any():
+        while True:
+            degree = mutual @ alive.astype(np.int32)
+            pruned = alive & (degree < k)
+            if not pruned.any():
+                break
+            alive &= ~pruned
+        core[alive] = k
+        k += 1
+
+    return core
+
+
+def analyse_clusters(seeds, edges, min_component=2):
+    """Build the shared graph and compute seed overlaps, connected components and dense cores."""
+    nodes, _, mutual = build_graph(seeds, edges)
+    pairs = seed_overlap(nodes, mutual, len(seeds))
+
+    _, labels = connected_components(mutual, directed=False)
+    sizes = np.bincount(labels)
+    core = core_numbers(mutual)
+    degree = np.diff(mutual.indptr)
+
+    components = []
+    for label in np.flatnonzero(sizes >= min_component)[np.argsort(-sizes[sizes >= min_component])]:
+        members = np.flatnonzero(labels == label)
+        components.append({
+            "component": int(label),
+            "size": int(sizes[label]),
+            "seeds": [nodes[i] for i in members if i < len(seeds)],
+            "maxCore": int(core[members].max()),
+        })
+
+    accounts = [
+        {
+            "did": nodes[i],
+            "seed": bool(i < len(seeds)),
+            "component": int(labels[i]),
+            "mutualDegree": int(degree[i]),
+            "core": int(core[i]),
+        }
+        for i in np.lexsort((-degree, -core))
+        if sizes[labels[i]] >= min_component
+    ]
+
+    logging.info(
+        f"Found {len(components)} clusters; densest core is {int(core.max()) if len(core) else 0}-connected."
+    )
+    return {"pairs": pairs, "components": components, "accounts": accounts}
+
+
+def write_results(results, prefix, output_format):
+    """Write the cluster analysis as one JSON file or one CSV per table."""
+    if output_format == "json":
+        path = f"{prefix}.json"
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Wrote cluster analysis to {path}.")
+        return
+
+    for table, rows in results.items():
+        path = f"{prefix}_{table}.csv"
+        with open(path, "w", newline="") as f:
+            if rows:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow({k: ";".join(v) if isinstance(v, list) else v for k, v in row.items()})
+        logging.info(f"Wrote {len(rows)} rows to {path}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map mutual-follow clusters around a list of seed DIDs.")
+    parser.add_argument("seeds", help="File with one seed DID per line.")
+    parser.add_argument("--output", default="clusters", help="Output file prefix.")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="Output format.")
+    parser.add_argument("--min-component", type=int, default=2, help="Smallest cluster size to report.")
+    args = parser.parse_args(argv)
+
+    seeds = load_seeds(args.seeds)
+    if not seeds:
+        logging.error("No seed DIDs to scan.")
+        return
+
+    # Get access token
+    mutualsnoop.get_access_token()
+
+    edges = fetch_edges(seeds)
+    results = analyse_clusters(seeds, edges, args.min_component)
+    write_results(results, args.output, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import configparser
+import logging
+import os
+
+# Settings are read from the [ozone] section of this file, then overridden by OZONE_<NAME> environment variables.
+# The default sits next to the scripts, so cron jobs started from another directory still find it.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get("OZONE_CONFIG", os.path.join(BASE_DIR, "ozone.ini"))
+SECTION = "ozone"
+ENV_PREFIX = "OZONE_"
+
+_settings = None
+
+
+def load(path=CONFIG_PATH):
+    """Read the config file once; a missing file leaves every setting at its default (or environment override)."""
+    global _settings
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str.upper
+    if not parser.read(path):
+        # A module logger, so the scripts' own logging.basicConfig calls still take effect
+        logging.getLogger(__name__).warning(f"No config file read from {path}; using defaults and OZONE_* variables.")
+    _settings = dict(parser[SECTION]) if parser.has_section(SECTION) else {}
+    return _settings
+
+
+def get(name, default=None):
+    """Return a setting from the environment or config file, converted to the type of the default."""
+    if _settings is None:
+        load()
+
+    value = os.environ.get(ENV_PREFIX + name, _settings.get(name))
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def get_path(name, default):
+    """Return a file path setting, resolving relative paths next to the scripts rather than the working directory."""
+    return os.path.join(BASE_DIR, os.path.expanduser(get(name, default)))
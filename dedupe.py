@@ -2,23 +2,28 @@ import psycopg2
 import logging
 from datetime import datetime
 
+import config
+import retryqueue
+from autolabel import is_post_review
+from sharding import parse_shard_args, shard_query, claim_review, release_subject, log_progress, run_sharded
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Database configuration
-DB_NAME = "ozone"
-DB_USER = "postgres"
-DB_PASSWORD = "your_postgres_password"
-DB_HOST = "localhost"
-DB_PORT = 5432
+DB_NAME = config.get("DB_NAME", "ozone")
+DB_USER = config.get("DB_USER", "postgres")
+DB_PASSWORD = config.get("DB_PASSWORD", "your_postgres_password")
+DB_HOST = config.get("DB_HOST", "localhost")
+DB_PORT = config.get("DB_PORT", 5432)
 
 # Labeler configuration
-LABELER_DID = "foo"
-LABEL = "foo"  # Specify the label to check
+LABELER_DID = config.get("LABELER_DID", "foo")
+LABEL = config.get("LABEL", "foo")  # Specify the label to check
 
 
-def fetch_open_reviews():
-    """Fetch records with 'reviewOpen' state from the moderation_subject_status table."""
+def fetch_open_reviews(shard=0, shards=1):
+    """Fetch records with 'reviewOpen' state from the moderation_subject_status table, optionally for one shard."""
     records = []
     try:
         logging.info("Connecting to the PostgreSQL database...")
@@ -32,18 +37,20 @@ def fetch_open_reviews():
         cursor = conn.cursor()
 
         query = """
-        SELECT id, did, "reviewState", comment
+        SELECT id, did, "recordPath", "reviewState", comment
         FROM moderation_subject_status
         WHERE "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
         """
-        cursor.execute(query)
+        query, params = shard_query(query, shard, shards)
+        cursor.execute(query, params)
         results = cursor.fetchall()
 
         for row in results:
-            record_id, did, review_state, comment = row
+            record_id, did, record_path, review_state, comment = row
             records.append({
                 "id": record_id,
                 "did": did,
+                "recordPath": record_path or "",
                 "reviewState": review_state,
                 "comment": comment
             })
@@ -58,9 +65,9 @@ def fetch_open_reviews():
 
 
 def label_exists(conn, did, label):
-    """Check if the label already exists for a given DID."""
+    """Check if the label already exists for a given DID, raising on failure."""
+    cursor = conn.cursor()
     try:
-        cursor = conn.cursor()
         uri = did  # Use DID directly as the URI
         query = """
         SELECT 1
@@ -69,36 +76,91 @@ def label_exists(conn, did, label):
         """
         cursor.execute(query, (LABELER_DID, uri, label))
         exists = cursor.fetchone() is not None
+    finally:
         cursor.close()
-        logging.debug(f"Label existence check for DID {did}, label '{label}': {exists}")
-        return exists
-    except Exception as e:
-        logging.error(f"Error checking label for DID {did}: {e}")
-        return False
+    logging.debug(f"Label existence check for DID {did}, label '{label}': {exists}")
+    return exists
+
+
+def mark_review_closed(conn, record_id):
+    """Close a review that is still open, raising on failure. A replay must not close an escalated review."""
+    resolved_at = datetime.utcnow().isoformat()
+    cursor = conn.cursor()
+    query = """
+    UPDATE moderation_subject_status
+    SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
+        "lastReviewedAt" = %s,
+        "updatedAt" = %s
+    WHERE id = %s AND "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
+    """
+    cursor.execute(query, (resolved_at, resolved_at, record_id))
+    conn.commit()
+    cursor.close()
 
 
 def close_review(conn, record_id):
-    """Close the review by updating its reviewState to 'reviewClosed'."""
+    """Close the review by updating its reviewState to 'reviewClosed', queueing it for retry on failure."""
     try:
-        resolved_at = datetime.utcnow().isoformat()
-        cursor = conn.cursor()
-        query = """
-        UPDATE moderation_subject_status
-        SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
-            "lastReviewedAt" = %s,
-            "updatedAt" = %s
-        WHERE id = %s;
-        """
-        cursor.execute(query, (resolved_at, resolved_at, record_id))
-        conn.commit()
+        mark_review_closed(conn, record_id)
         logging.info(f"Successfully closed review with record ID {record_id}.")
-        cursor.close()
+        retryqueue.resolve("dedupe.close_review", {"id": record_id})
     except Exception as e:
         logging.error(f"Failed to close review with record ID {record_id}: {e}")
+        retryqueue.record_failure("dedupe.close_review", {"id": record_id}, e)
+        retryqueue.rollback_quietly(conn)
 
 
-def process_reviews():
-    """Fetch open reviews and close those with the specified label."""
+def check_review(conn, record_id, did):
+    """Close the review if its DID already has the label, queueing the check for retry if it fails."""
+    try:
+        exists = label_exists(conn, did, LABEL)
+    except Exception as e:
+        logging.error(f"Error checking label for DID {did}: {e}")
+        retryqueue.record_failure("dedupe.check_review", {"id": record_id, "did": did, "label": LABEL}, e)
+        retryqueue.rollback_quietly(conn)
+        return
+
+    retryqueue.resolve("dedupe.check_review", {"id": record_id, "did": did, "label": LABEL})
+    if exists:
+        logging.info(f"DID {did} already has label '{LABEL}'. Closing review {record_id}...")
+        close_review(conn, record_id)
+    else:
+        logging.debug(f"DID {did} does not have label '{LABEL}'. Skipping review {record_id}.")
+
+
+def retry_close_review(payload):
+    """Replay a failed review closure."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        mark_review_closed(conn, payload["id"])
+    finally:
+        conn.close()
+
+
+def retry_check_review(payload):
+    """Replay a failed label check, closing the review if the DID turns out to be labelled."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        if label_exists(conn, payload["did"], payload["label"]):
+            mark_review_closed(conn, payload["id"])
+    finally:
+        conn.close()
+
+
+def process_reviews(shard=0, shards=1):
+    """Fetch open reviews (optionally for one shard) and close those with the specified label."""
     try:
         conn = psycopg2.connect(
             dbname=DB_NAME,
@@ -108,11 +170,13 @@ def process_reviews():
             port=DB_PORT
         )
 
-        # Fetch open reviews
-        open_reviews = fetch_open_reviews()
+        # Fetch open reviews. An account label says nothing about a reported post, so post reviews are
+        # left to autolabel's post sweep, as in the pipeline
+        open_reviews = [review for review in fetch_open_reviews(shard, shards) if not is_post_review(review)]
 
         # Process each review
-        for review in open_reviews:
+        for done, review in enumerate(open_reviews, start=1):
+            log_progress(shard, shards, done - 1, len(open_reviews))
             record_id = review.get("id")
             did = review.get("did")
 
@@ -120,19 +184,27 @@ def process_reviews():
                 logging.warning(f"Skipping review with missing ID or DID: {review}")
                 continue
 
-            # Check if the DID already has the specified label
-            if label_exists(conn, did, LABEL):
-                logging.info(f"DID {did} already has label '{LABEL}'. Closing review {record_id}...")
-                close_review(conn, record_id)
-            else:
-                logging.debug(f"DID {did} does not have label '{LABEL}'. Skipping review {record_id}.")
+            if not claim_review(conn, record_id, did):
+                continue
+
+            try:
+                # Check if the DID already has the specified label
+                check_review(conn, record_id, did)
+            finally:
+                release_subject(conn, did)
 
+        log_progress(shard, shards, len(open_reviews), len(open_reviews), force=True)
         conn.close()
     except Exception as e:
         logging.error(f"Error processing reviews: {e}")
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    args = parse_shard_args(argv, "Close open reviews on accounts that already carry LABEL.")
     logging.info("Starting review processing...")
-    process_reviews()
+    run_sharded(process_reviews, args)
     logging.info("Review processing completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 import requests
 import logging
+import argparse
+
+import config
+from burstdetect import detect_bursts, log_report
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Bluesky API configuration
-API_URL = "https://bsky.social/xrpc"
-USERNAME = "your_bluesky_username"
-PASSWORD = "your_bluesky_app_password"
+API_URL = config.get("API_URL", "https://bsky.social/xrpc")
+USERNAME = config.get("BSKY_USERNAME", "your_bluesky_username")
+PASSWORD = config.get("BSKY_PASSWORD", "your_bluesky_app_password")
 
 # Authentication token
 access_token = None
@@ -144,10 +148,12 @@ def find_common_accounts(did1, did2):
     return detailed_results
 
 
-def main():
-    # Replace these with the DIDs to compare
-    DID1 = "did:plc:example1"
-    DID2 = "did:plc:example2"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List accounts that are mutuals of both of two accounts.")
+    parser.add_argument("did1", help="First DID to compare.")
+    parser.add_argument("did2", help="Second DID to compare.")
+    args = parser.parse_args(argv)
+    DID1, DID2 = args.did1, args.did2
 
     # Get access token
     get_access_token()
@@ -155,14 +161,16 @@ def main():
     # Find common accounts
     common_accounts = find_common_accounts(DID1, DID2)
 
-    # Output results
-    logging.info("Common accounts:")
+    # Output the raw rows at debug level and a ranked burst report instead
+    logging.debug("Common accounts:")
     for account in common_accounts:
-        logging.info(
+        logging.debug(
             f"DID: {account['did']}, Handle: {account['handle']}, Followers: {account['followersCount']}, "
             f"Following: {account['followsCount']}, Registered: {account['createdAt']}"
         )
 
+    log_report(detect_bursts(common_accounts))
+
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,17 @@
 import requests
 import logging
+import argparse
+
+import config
+from burstdetect import detect_bursts, log_report
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Bluesky API configuration
-API_URL = "https://bsky.social/xrpc"
-USERNAME = "your_bluesky_username"
-PASSWORD = "your_bluesky_app_password"
+API_URL = config.get("API_URL", "https://bsky.social/xrpc")
+USERNAME = config.get("BSKY_USERNAME", "your_bluesky_username")
+PASSWORD = config.get("BSKY_PASSWORD", "your_bluesky_app_password")
 
 # Authentication token
 access_token = None
@@ -138,9 +142,10 @@ def find_mutual_connections(did):
     return detailed_results
 
 
-def main():
-    # Replace this with the DID to scan
-    DID = "did:plc:example"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List an account's mutual follows with their signup dates.")
+    parser.add_argument("did", help="DID to scan.")
+    DID = parser.parse_args(argv).did
 
     # Get access token
     get_access_token()
@@ -148,14 +153,16 @@ def main():
     # Find mutual connections
     mutual_connections = find_mutual_connections(DID)
 
-    # Output results
-    logging.info("Mutual connections:")
+    # Output the raw rows at debug level and a ranked burst report instead
+    logging.debug("Mutual connections:")
     for connection in mutual_connections:
-        logging.info(
+        logging.debug(
             f"DID: {connection['did']}, Handle: {connection['handle']}, Followers: {connection['followersCount']}, "
             f"Following: {connection['followsCount']}, Registered: {connection['createdAt']}"
         )
 
+    log_report(detect_bursts(mutual_connections))
+
 
 if __name__ == "__main__":
     main()
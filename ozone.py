@@ -0,0 +1,43 @@
+import argparse
+import importlib
+import sys
+
+# Subcommand name -> (module, description). Modules are only imported once their subcommand is chosen,
+# so a run pays for discord, atproto, psycopg2 or numpy only when that subcommand needs them.
+COMMANDS = {
+    "autolabel": ("autolabel", "Auto-label accounts whose handle matches the keyword pattern."),
+    "dedupe": ("dedupe", "Close open reviews on accounts that are already labelled."),
+    "pipeline": ("pipeline", "Run dedupe, autolabel and notification over one scan of the queue."),
+    "reportbot": ("reportbot", "Post open reviews to a Discord channel."),
+    "reporter": ("reporter", "Report every member of a Bluesky list to the labeler."),
+    "mutualsnoop": ("mutualsnoop", "List an account's mutual follows with their signup dates."),
+    "dualmutualsnoop": ("dualmutualsnoop", "List accounts that are mutuals of both of two accounts."),
+    "clustersnoop": ("clustersnoop", "Map mutual-follow clusters around a list of seed DIDs."),
+    "plcindex": ("plcindex", "Build and query the offline DID -> handle index from PLC exports."),
+    "retry": ("retryqueue", "Replay, requeue and count failed operations."),
+}
+
+
+def load_command(name):
+    """Import the module behind a subcommand."""
+    return importlib.import_module(COMMANDS[name][0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ozone",
+        description="Ozone moderation scripts. Settings come from ozone.ini (or $OZONE_CONFIG) and OZONE_* variables.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, (_, description) in COMMANDS.items():
+        subparsers.add_parser(name, help=description, add_help=False)
+
+    # Only the subcommand name is parsed here; everything after it, --help included, goes to the script
+    argv = sys.argv[1:] if argv is None else argv
+    args = parser.parse_args(argv[:1])
+
+    load_command(args.command).main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import psycopg2
+from psycopg2.extras import execute_values
+import requests
+import logging
+from datetime import datetime
+import re
+import argparse
+import sqlite3
+import time
+
+import config
+import retryqueue
+from autolabel import get_access_token, open_handle_index, resolve_handle, is_post_review, process_post_reviews
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Database configuration
+DB_NAME = config.get("DB_NAME", "ozone")
+DB_USER = config.get("DB_USER", "postgres")
+DB_PASSWORD = config.get("DB_PASSWORD", "foo")
+DB_HOST = config.get("DB_HOST", "localhost")
+DB_PORT = config.get("DB_PORT", 5432)
+
+# API configuration
+API_URL = config.get("API_URL", "https://bsky.social/xrpc")
+ADMIN_USERNAME = config.get("ADMIN_USERNAME", "foo")
+ADMIN_PASSWORD = config.get("ADMIN_PASSWORD", "foo")
+LABEL = config.get("LABEL", "foo")
+KEYWORD_PATTERN = re.compile(config.get("KEYWORD_PATTERN", r"keyword"), re.IGNORECASE)  # Case-insensitive regex for "keyword"
+LABELER_DID = config.get("LABELER_DID", "foo")
+
+# Discord configuration
+DISCORD_API_URL = config.get("DISCORD_API_URL", "https://discord.com/api/v10")
+DISCORD_TOKEN = config.get("DISCORD_TOKEN", "your_discord_bot_token")  # Replace with your bot's token
+DISCORD_CHANNEL_ID = config.get("DISCORD_CHANNEL_ID", 123456789012345678)   # Replace with your channel ID
+
+# Reviews already posted to Discord, so each cycle only notifies reviews that are new since the last one
+PIPELINE_STATE_PATH = config.get_path("PIPELINE_STATE_PATH", "pipeline_state.sqlite")
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notified (
+    id INTEGER PRIMARY KEY,
+    notified_at INTEGER NOT NULL
+);
+"""
+
+# Stages run in this order; the first stage that handles a review stops it there.
+# They match accounts; post reviews are matched on their text by autolabel's post sweep instead.
+STAGES = ["dedupe", "autolabel", "notify"]
+
+
+def open_state(path=PIPELINE_STATE_PATH):
+    """Open (creating if needed) the record of reviews already notified."""
+    state = sqlite3.connect(path, timeout=30)
+    state.executescript(STATE_SCHEMA)
+    return state
+
+
+def fetch_notified(state):
+    """Return the IDs of reviews notified in earlier cycles."""
+    return {row[0] for row in state.execute("SELECT id FROM notified;")}
+
+
+def save_notified(state, notified, open_ids):
+    """Record newly notified reviews and forget the ones that are no longer open."""
+    now = int(time.time())
+    state.executemany("INSERT OR IGNORE INTO notified (id, notified_at) VALUES (?, ?);", [(i, now) for i in notified])
+    stale = fetch_notified(state) - set(open_ids)
+    state.executemany("DELETE FROM notified WHERE id = ?;", [(i,) for i in stale])
+    state.commit()
+
+
+def fetch_open_reviews(conn):
+    """Fetch records with 'reviewOpen' state from the moderation_subject_status table."""
+    cursor = conn.cursor()
+    query = """
+    SELECT id, did, "recordPath", "reviewState", comment
+    FROM moderation_subject_status
+    WHERE "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
+    """
+    cursor.execute(query)
+    records = [
+        {"id": record_id, "did": did, "recordPath": record_path or "", "reviewState": review_state, "comment": comment}
+        for record_id, did, record_path, review_state, comment in cursor.fetchall()
+    ]
+    cursor.close()
+    logging.info(f"Fetched {len(records)} open reviews from the database.")
+    return records
+
+
+def fetch_labelled_dids(conn, dids, label):
+    """Return the subset of DIDs that already carry the label, using a single query."""
+    cursor = conn.cursor()
+    query = """
+    SELECT "uri"
+    FROM label
+    WHERE "src" = %s AND "val" = %s AND "uri" = ANY(%s);
+    """
+    cursor.execute(query, (LABELER_DID, label, list(dids)))
+    labelled = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    logging.info(f"{len(labelled)} of {len(dids)} DIDs already have label '{label}'.")
+    return labelled
+
+
+def dedupe_stage(review, cycle):
+    """Close the review if its DID already carries the label."""
+    if review["did"] in cycle["labelled"]:
+        logging.debug(f"DID {review['did']} already has label '{LABEL}'. Closing review {review['id']}.")
+        cycle["close"].append(review["id"])
+        return True
+    return False
+
+
+def autolabel_stage(review, cycle):
+    """Label the DID and close the review if its handle matches the keyword pattern."""
+    did = review["did"]
+    if did not in cycle["handles"]:
+        cycle["handles"][did] = resolve_handle(API_URL, cycle["access_token"], did, cycle["index"])
+    username = cycle["handles"][did]
+
+    if username and KEYWORD_PATTERN.search(username):
+        logging.debug(f"Username '{username}' matches pattern. Labelling DID {did} and closing review {review['id']}.")
+        # Later reviews for the same DID are then closed by the dedupe stage
+        cycle["labels"].append(did)
+        cycle["labelled"].add(did)
+        cycle["close"].append(review["id"])
+        return True
+    return False
+
+
+def notify_stage(review, cycle):
+    """Queue the review for a Discord notification unless an earlier cycle already sent it."""
+    if review["id"] not in cycle["notified"]:
+        cycle["notify"].append(review)
+    return True
+
+
+STAGE_FUNCTIONS = {
+    "dedupe": dedupe_stage,
+    "autolabel": autolabel_stage,
+    "notify": notify_stage,
+}
+
+
+def run_stages(reviews, cycle, stages):
+    """Stream each review through the stages until one of them handles it."""
+    for review in reviews:
+        if not review.get("id") or not review.get("did"):
+            logging.warning(f"Skipping review with missing ID or DID: {review}")
+            continue
+
+        for stage in stages:
+            if STAGE_FUNCTIONS[stage](review, cycle):
+                break
+
+
+def run_post_reviews(conn, reviews, cycle, stages):
+    """Sweep post reviews through autolabel's text matching, then queue the unmatched ones for notification."""
+    if "autolabel" in stages:
+        reviews = process_post_reviews(conn, cycle["access_token"], reviews)
+    if "notify" in stages:
+        for review in reviews:
+            notify_stage(review, cycle)
+
+
+def write_batch(conn, labels, close):
+    """Insert labels for the given DIDs and close those of the given reviews still open, in one transaction.
+
+    Raises on failure. Reviews a moderator has since escalated or closed are left alone when a batch is replayed.
+    """
+    resolved_at = datetime.utcnow().isoformat()
+    cursor = conn.cursor()
+    try:
+        if labels:
+            insert_query = """
+            INSERT INTO label ("src", "uri", "cid", "val", "neg", "cts")
+            VALUES %s
+            ON CONFLICT DO NOTHING;
+            """
+            rows = [(LABELER_DID, did, "", LABEL, False, resolved_at) for did in labels]
+            execute_values(cursor, insert_query, rows)
+
+        if close:
+            update_query = """
+            UPDATE moderation_subject_status
+            SET "reviewState" = 'tools.ozone.moderation.defs#reviewClosed',
+                "lastReviewedAt" = %s,
+                "updatedAt" = %s
+            WHERE id = ANY(%s) AND "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
+            """
+            cursor.execute(update_query, (resolved_at, resolved_at, close))
+
+        conn.commit()
+    except Exception:
+        retryqueue.rollback_quietly(conn)
+        raise
+    finally:
+        cursor.close()
+
+
+def write_results(conn, cycle):
+    """Apply all queued labels and review closures, queueing the whole batch for retry on failure."""
+    try:
+        write_batch(conn, cycle["labels"], cycle["close"])
+        logging.info(f"Applied {len(cycle['labels'])} labels and closed {len(cycle['close'])} reviews.")
+        retryqueue.resolve("pipeline.write_results", {"labels": cycle["labels"], "close": cycle["close"]})
+    except Exception as e:
+        logging.error(f"Failed to write pipeline results: {e}")
+        retryqueue.record_failure("pipeline.write_results", {"labels": cycle["labels"], "close": cycle["close"]}, e)
+
+
+def post_notification(session, review):
+    """Post one review to the Discord channel through the REST API, raising on failure."""
+    headers = {"Authorization": f"Bot {DISCORD_TOKEN}"}
+    url = f"{DISCORD_API_URL}/channels/{DISCORD_CHANNEL_ID}/messages"
+    embed = {
+        "title": "New Ozone Review",
+        "description": f"**DID**: {review['did']}\n**Comment**: {review['comment'] or 'No comment provided'}",
+        "color": 0x3498DB,
+        "footer": {"text": f"Review ID: {review['id']}"},
+    }
+    response = session.post(url, headers=headers, json={"embeds": [embed]})
+    if response.status_code != 200:
+        raise requests.HTTPError(f"{response.status_code} - {response.text}", response=response)
+
+
+def send_notifications(reviews):
+    """Post each queued review to Discord, queueing failed ones for retry."""
+    with requests.Session() as session:
+        for review in reviews:
+            payload = {"id": review["id"], "did": review["did"], "comment": review["comment"]}
+            try:
+                post_notification(session, review)
+                logging.info(f"Sent review {review['id']} to Discord.")
+                retryqueue.resolve("pipeline.notify", payload)
+            except Exception as e:
+                logging.error(f"Failed to send review {review['id']} to Discord: {e}")
+                retryqueue.record_failure("pipeline.notify", payload, e)
+
+
+def retry_write_results(payload):
+    """Replay a failed batch of label inserts and review closures."""
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+    try:
+        write_batch(conn, payload["labels"], payload["close"])
+    finally:
+        conn.close()
+
+
+def retry_notify(payload):
+    """Replay a failed Discord notification."""
+    with requests.Session() as session:
+        post_notification(session, payload)
+
+
+def run_cycle(stages=STAGES):
+    """Run one moderation cycle: one scan, one batch of writes, then notifications for new reviews."""
+    cycle = {
+        "access_token": None,
+        "index": None,
+        "labelled": set(),
+        "handles": {},
+        "labels": [],
+        "close": [],
+        "notified": set(),
+        "notify": [],
+    }
+
+    if "autolabel" in stages:
+        cycle["access_token"] = get_access_token(API_URL, ADMIN_USERNAME, ADMIN_PASSWORD)
+        cycle["index"] = open_handle_index()
+
+    try:
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT
+        )
+    except Exception as e:
+        logging.error(f"Failed to connect to the database: {e}")
+        return
+
+    state = open_state()
+    cycle["notified"] = fetch_notified(state)
+    open_ids = None
+    scanned = False
+    try:
+        reviews = fetch_open_reviews(conn)
+        open_ids = [review["id"] for review in reviews]
+        post_reviews = [review for review in reviews if is_post_review(review)]
+        reviews = [review for review in reviews if not is_post_review(review)]
+        dids = {review["did"] for review in reviews if review.get("did")}
+        if dids:
+            cycle["labelled"] = fetch_labelled_dids(conn, dids, LABEL)
+
+        run_stages(reviews, cycle, stages)
+        if post_reviews:
+            run_post_reviews(conn, post_reviews, cycle, stages)
+        scanned = True
+        write_results(conn, cycle)
+    except Exception as e:
+        logging.error(f"Error running moderation pipeline: {e}")
+    finally:
+        conn.close()
+        if cycle["index"] is not None:
+            cycle["index"].close()
+
+    # Notified reviews are the ones no stage labels or closes, so they do not depend on the batch write
+    if scanned:
+        if cycle["notify"]:
+            # Failed notifications are replayed from the retry queue, so they count as sent here too
+            send_notifications(cycle["notify"])
+        save_notified(state, [review["id"] for review in cycle["notify"]], open_ids)
+    state.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one moderation cycle over the open review queue.")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGE_FUNCTIONS), default=STAGES, help="Stages to run, in order.")
+    args = parser.parse_args(argv)
+
+    logging.info(f"Starting moderation pipeline with stages: {', '.join(args.stages)}")
+    run_cycle(args.stages)
+    logging.info("Moderation pipeline completed.")
+
+
+if __name__ == "__main__":
+    main()
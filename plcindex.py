@@ -0,0 +1,173 @@
+import argparse
+import gzip
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+
+import config
+
+# A module logger: this is imported by the scripts, so it must not configure logging before they do
+log = logging.getLogger(__name__)
+
+# Index configuration
+PLC_INDEX_PATH = config.get_path("PLC_INDEX_PATH", "plc_index.sqlite")
+# Seconds before an entry must be re-checked. Imported entries are as fresh as the newest operation in the
+# index, not the time of the import, so an old export is stale from the start.
+PLC_INDEX_MAX_AGE = config.get("PLC_INDEX_MAX_AGE", 7 * 24 * 3600)
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS handles (
+    did TEXT PRIMARY KEY,
+    handle TEXT,
+    op_at TEXT NOT NULL,
+    indexed_at INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+# Newer operations replace older ones; replaying an operation that is already indexed is a no-op
+UPSERT_QUERY = """
+INSERT INTO handles (did, handle, op_at, indexed_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (did) DO UPDATE
+SET handle = excluded.handle, op_at = excluded.op_at, indexed_at = excluded.indexed_at
+WHERE excluded.op_at >= handles.op_at;
+"""
+
+
+def open_index(path=PLC_INDEX_PATH):
+    """Open (creating if needed) the DID -> handle index."""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def operation_handle(operation):
+    """Return the handle an operation sets, or None for tombstones and operations without one."""
+    if operation.get("type") == "create":
+        # Legacy genesis operations carry the bare handle
+        return operation.get("handle")
+    for aka in operation.get("alsoKnownAs") or []:
+        if aka.startswith("at://"):
+            return aka[len("at://"):]
+    return None
+
+
+def timestamp_of(created_at):
+    """Convert an operation's createdAt into epoch seconds, or 0 when it cannot be parsed."""
+    try:
+        return int(datetime.fromisoformat(created_at).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def open_export(path):
+    """Open a PLC export segment, transparently decompressing .gz files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def import_export(conn, path):
+    """Stream a PLC directory export (JSONL operations) into the index.
+
+    Operations older than the newest one already imported are skipped, so newer export segments can be
+    appended without replaying the earlier ones.
+    """
+    row = conn.execute("SELECT value FROM meta WHERE key = 'last_created_at';").fetchone()
+    last_created_at = row[0] if row else ""
+    newest = last_created_at
+    batch, imported, skipped = [], 0, 0
+
+    with open_export(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            did = entry.get("did") if isinstance(entry, dict) else None
+            if not did:
+                log.warning(f"Skipping malformed line {line_number} in {path}.")
+                continue
+
+            created_at = entry.get("createdAt", "")
+            if entry.get("nullified") or created_at < last_created_at:
+                skipped += 1
+                continue
+
+            # Tombstones are stored with a NULL handle so an older operation cannot resurrect the DID
+            handle = operation_handle(entry.get("operation") or {})
+            batch.append((did, handle, created_at, timestamp_of(created_at)))
+            newest = max(newest, created_at)
+
+            if len(batch) >= BATCH_SIZE:
+                conn.executemany(UPSERT_QUERY, batch)
+                imported += len(batch)
+                batch = []
+
+    conn.executemany(UPSERT_QUERY, batch)
+    imported += len(batch)
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_created_at', ?);", (newest,)
+    )
+    conn.commit()
+    log.info(f"Imported {imported} operations from {path} ({skipped} skipped); index is current to {newest}.")
+    return imported
+
+
+def lookup_handle(conn, did, max_age=PLC_INDEX_MAX_AGE):
+    """Return the indexed handle for a DID, or None when it is missing, tombstoned or older than max_age.
+
+    An entry is as fresh as the later of its own check and the newest imported operation: an export
+    that holds no newer operation for the DID confirms the handle was still current at that point.
+    """
+    row = conn.execute("SELECT handle, indexed_at FROM handles WHERE did = ?;", (did,)).fetchone()
+    if row is None or row[0] is None:
+        return None
+    current_to = conn.execute("SELECT value FROM meta WHERE key = 'last_created_at';").fetchone()
+    checked_at = max(row[1], timestamp_of(current_to[0]) if current_to else 0)
+    if checked_at < time.time() - max_age:
+        return None
+    return row[0]
+
+
+def store_handle(conn, did, handle):
+    """Record a handle resolved elsewhere (e.g. by the API) so the next lookup is served locally."""
+    now = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+    conn.execute(UPSERT_QUERY, (did, handle, now, int(time.time())))
+    conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query an offline DID -> handle index from PLC exports.")
+    parser.add_argument("--index", default=PLC_INDEX_PATH, help="Path of the SQLite index.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    import_parser = subparsers.add_parser("import", help="Append one or more export segments, oldest first.")
+    import_parser.add_argument("exports", nargs="+", help="PLC export JSONL files (optionally .gz).")
+    lookup_parser = subparsers.add_parser("lookup", help="Look up the handle of one or more DIDs.")
+    lookup_parser.add_argument("dids", nargs="+")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    conn = open_index(args.index)
+    if args.action == "import":
+        for path in args.exports:
+            import_export(conn, path)
+    else:
+        for did in args.dids:
+            print(f"{did}\t{lookup_handle(conn, did, max_age=float('inf')) or ''}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,49 @@
 import psycopg2
 import discord
+from discord import app_commands
 from discord.ext import tasks
 import logging
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+import heapq
+
+import config
+import retryqueue
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Discord bot configuration
-DISCORD_TOKEN = "your_discord_bot_token"  # Replace with your bot's token
-DISCORD_CHANNEL_ID = 123456789012345678   # Replace with your channel ID
+DISCORD_TOKEN = config.get("DISCORD_TOKEN", "your_discord_bot_token")  # Replace with your bot's token
+DISCORD_CHANNEL_ID = config.get("DISCORD_CHANNEL_ID", 123456789012345678)   # Replace with your channel ID
 
 # Database configuration
-DB_NAME = "ozone"
-DB_USER = "postgres"
-DB_PASSWORD = "your_postgres_password"
-DB_HOST = "localhost"
-DB_PORT = 5432
+DB_NAME = config.get("DB_NAME", "ozone")
+DB_USER = config.get("DB_USER", "postgres")
+DB_PASSWORD = config.get("DB_PASSWORD", "your_postgres_password")
+DB_HOST = config.get("DB_HOST", "localhost")
+DB_PORT = config.get("DB_PORT", 5432)
+
+# Polls between full reconciliation scans of the open queue (60 polls = once an hour)
+RECONCILE_EVERY = config.get("RECONCILE_EVERY", 60)
 
 # Discord client setup
 intents = discord.Intents.default()
 client = discord.Client(intents=intents)
+tree = app_commands.CommandTree(client)
+
+# In-memory queue summary answering the slash commands, kept current from each poll
+summary = {
+    "open": {},  # review ID -> review
+    "subjects": Counter(),  # DID -> number of open reviews
+    "watermark": None,  # Newest "updatedAt" seen so far
+    "polls": 0,
+}
 
 
 def fetch_open_reviews():
-    """Fetch records with 'reviewOpen' state from the moderation_subject_status table."""
-    records = []
+    """Fetch records with 'reviewOpen' state from the moderation_subject_status table, or None on error."""
     try:
         logging.info("Connecting to the PostgreSQL database...")
         conn = psycopg2.connect(
@@ -38,72 +57,234 @@ def fetch_open_reviews():
 
         # Query open reviews
         query = """
-        SELECT id, "did", "reviewState", comment
+        SELECT id, "did", "reviewState", comment, "createdAt", "updatedAt"
         FROM moderation_subject_status
         WHERE "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
         """
         cursor.execute(query)
-        results = cursor.fetchall()
+        records = [review_from_row(row) for row in cursor.fetchall()]
 
-        if not results:
+        cursor.close()
+        conn.close()
+        if records:
+            logging.info(f"Fetched {len(records)} open reviews from the database.")
+        else:
             logging.info("No open reviews found.")
-            return records
+        return records
+    except Exception as e:
+        logging.error(f"Failed to fetch open reviews from the database: {e}")
+        return None
+
+
+def fetch_review_changes(since):
+    """Fetch every review (open or not) updated at or after the given "updatedAt" watermark."""
+    try:
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT
+        )
+        cursor = conn.cursor()
 
-        for row in results:
-            record_id, did, review_state, comment = row
-            records.append({
-                "id": record_id,
-                "did": did,
-                "reviewState": review_state,
-                "comment": comment or "No comment provided"
-            })
+        # Re-reading rows at the watermark itself catches changes committed with the same timestamp
+        query = """
+        SELECT id, "did", "reviewState", comment, "createdAt", "updatedAt"
+        FROM moderation_subject_status
+        WHERE "updatedAt" >= %s;
+        """
+        cursor.execute(query, (since,))
+        records = [review_from_row(row) for row in cursor.fetchall()]
 
         cursor.close()
         conn.close()
-        logging.info(f"Fetched {len(records)} open reviews from the database.")
+        logging.debug(f"Fetched {len(records)} changed reviews since {since}.")
+        return records
     except Exception as e:
-        logging.error(f"Failed to fetch open reviews from the database: {e}")
+        logging.error(f"Failed to fetch review changes from the database: {e}")
+        return None
 
-    return records
 
+def review_from_row(row):
+    """Convert a moderation_subject_status row into a review dict."""
+    record_id, did, review_state, comment, created_at, updated_at = row
+    return {
+        "id": record_id,
+        "did": did,
+        "reviewState": review_state,
+        "comment": comment or "No comment provided",
+        "createdAt": str(created_at),
+        "updatedAt": str(updated_at),
+    }
 
-async def send_report_to_discord(report):
-    """Send a new report message to the Discord channel."""
+
+def update_summary(reviews, full=False):
+    """Apply polled reviews to the queue summary and return the ones that were not open before.
+
+    A full update replaces the summary with the given open reviews; otherwise they are treated as deltas.
+    """
+    opened = []
+    if full:
+        previous = summary["open"]
+        summary["open"] = {review["id"]: review for review in reviews}
+        summary["subjects"] = Counter(review["did"] for review in reviews)
+        opened = [review for review in reviews if review["id"] not in previous]
+    else:
+        for review in reviews:
+            known = review["id"] in summary["open"]
+            if review["reviewState"] == "tools.ozone.moderation.defs#reviewOpen":
+                if not known:
+                    summary["subjects"][review["did"]] += 1
+                    opened.append(review)
+                summary["open"][review["id"]] = review
+            elif known:
+                closed = summary["open"].pop(review["id"])
+                summary["subjects"][closed["did"]] -= 1
+                if summary["subjects"][closed["did"]] <= 0:
+                    del summary["subjects"][closed["did"]]
+
+    for review in reviews:
+        if summary["watermark"] is None or review["updatedAt"] > summary["watermark"]:
+            summary["watermark"] = review["updatedAt"]
+    return opened
+
+
+def review_age(review):
+    """Describe how long ago a review was created, e.g. '3d 4h'."""
+    try:
+        created_at = datetime.fromisoformat(review["createdAt"])
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return "unknown age"
+    age = datetime.now(timezone.utc) - created_at
+    hours = age.seconds // 3600
+    minutes = age.seconds % 3600 // 60
+    return f"{age.days}d {hours}h" if age.days else f"{hours}h {minutes}m"
+
+
+async def post_report(report):
+    """Send a report message to the Discord channel, raising on failure."""
     channel = client.get_channel(DISCORD_CHANNEL_ID)
     if not channel:
-        logging.error("Discord channel not found!")
-        return
+        raise LookupError("Discord channel not found!")
+
+    embed = discord.Embed(
+        title="New Ozone Review",
+        description=f"**DID**: {report['did']}\n**Comment**: {report['comment']}",
+        color=discord.Color.blue(),
+    )
+    embed.set_footer(text=f"Review ID: {report['id']}")
+    await channel.send(embed=embed)
+
 
+async def send_report_to_discord(report):
+    """Send a new report message to the Discord channel, queueing it for retry on failure."""
+    payload = {"id": report["id"], "did": report["did"], "comment": report["comment"]}
     try:
-        embed = discord.Embed(
-            title="New Ozone Review",
-            description=f"**DID**: {report['did']}\n**Comment**: {report['comment']}",
-            color=discord.Color.blue(),
-        )
-        embed.set_footer(text=f"Review ID: {report['id']}")
-        await channel.send(embed=embed)
+        await post_report(report)
         logging.info(f"Sent review {report['id']} to Discord.")
+        retryqueue.resolve("reportbot.send_report", payload)
     except Exception as e:
         logging.error(f"Failed to send review {report['id']} to Discord: {e}")
+        retryqueue.record_failure("reportbot.send_report", payload, e)
+
+
+async def retry_failed_reports():
+    """Resend the reports whose retry is due."""
+    for op in retryqueue.due(["reportbot.send_report"]):
+        try:
+            await post_report(op["payload"])
+            retryqueue.mark_done(op["id"])
+            logging.info(f"Resent review {op['payload']['id']} to Discord.")
+        except Exception as e:
+            logging.warning(f"Retry of review {op['payload']['id']} failed: {e}")
+            retryqueue.mark_failed(op["id"], e)
 
 
 @tasks.loop(seconds=60)  # Check for new reviews every 60 seconds
 async def check_new_reviews():
-    """Periodic task to check for new reviews and send them to Discord."""
-    new_reviews = fetch_open_reviews()
+    """Periodic task to check for new reviews and send them to Discord.
+
+    The first poll and every RECONCILE_EVERY-th poll scan the whole open queue; the others only
+    fetch rows updated since the last poll. A failed fetch leaves the summary as it was.
+    """
+    if summary["watermark"] is None or summary["polls"] % RECONCILE_EVERY == 0:
+        reviews = fetch_open_reviews()
+        new_reviews = update_summary(reviews, full=True) if reviews is not None else []
+    else:
+        changes = fetch_review_changes(summary["watermark"])
+        new_reviews = update_summary(changes) if changes is not None else []
+    summary["polls"] += 1
+
     for review in new_reviews:
         await send_report_to_discord(review)
 
+    try:
+        await retry_failed_reports()
+    except Exception as e:
+        logging.error(f"Failed to replay queued reports: {e}")
+
+
+@tree.command(name="queue", description="Show how many reviews are open.")
+async def queue_command(interaction: discord.Interaction):
+    """Report the depth of the open review queue."""
+    embed = discord.Embed(
+        title="Ozone Review Queue",
+        description=f"**Open reviews**: {len(summary['open'])}\n**Subjects**: {len(summary['subjects'])}",
+        color=discord.Color.blue(),
+    )
+    embed.set_footer(text=f"As of {summary['watermark'] or 'startup'}")
+    await interaction.response.send_message(embed=embed)
+
+
+@tree.command(name="top-subjects", description="Show the DIDs with the most open reviews.")
+@app_commands.describe(count="How many DIDs to list (default 10).")
+async def top_subjects_command(interaction: discord.Interaction, count: app_commands.Range[int, 1, 25] = 10):
+    """List the DIDs with the most open reviews."""
+    lines = [f"{rank}. {did}: {total}" for rank, (did, total) in enumerate(summary["subjects"].most_common(count), 1)]
+    embed = discord.Embed(
+        title="Most Reviewed Subjects",
+        description="\n".join(lines) or "No open reviews.",
+        color=discord.Color.blue(),
+    )
+    await interaction.response.send_message(embed=embed)
+
+
+@tree.command(name="oldest", description="Show the oldest open reviews.")
+@app_commands.describe(count="How many reviews to list (default 5).")
+async def oldest_command(interaction: discord.Interaction, count: app_commands.Range[int, 1, 25] = 5):
+    """List the oldest open reviews."""
+    oldest = heapq.nsmallest(count, summary["open"].values(), key=lambda review: review["createdAt"])
+    lines = [f"Review {review['id']} ({review_age(review)}): {review['did']}" for review in oldest]
+    embed = discord.Embed(
+        title="Oldest Open Reviews",
+        description="\n".join(lines) or "No open reviews.",
+        color=discord.Color.blue(),
+    )
+    await interaction.response.send_message(embed=embed)
+
 
 @client.event
 async def on_ready():
     """Event triggered when the bot is ready."""
     logging.info(f"Bot logged in as {client.user}")
-    check_new_reviews.start()  # Start the periodic task
+    if not check_new_reviews.is_running():
+        try:
+            await tree.sync()  # Register the slash commands
+        except Exception as e:
+            logging.error(f"Failed to register slash commands: {e}")
+        check_new_reviews.start()  # Start the periodic task
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    argparse.ArgumentParser(description="Post open Ozone reviews to a Discord channel.").parse_args(argv)
     try:
         client.run(DISCORD_TOKEN)
     except Exception as e:
         logging.error(f"Failed to run the Discord bot: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,134 @@
 from atproto import Client, models
 import logging
+import argparse
+
+import config
+import retryqueue
 
 # Configure logging for verbose output
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Step 1: Login to Bluesky with account and app password
-client = Client()
-logging.info("Logging into Bluesky...")
-try:
-    client.login('bluesky username', 'application password')
-    logging.info("Login successful.")
-except Exception as e:
-    logging.error(f"Login failed: {e}")
-    exit(1)
-
-# Step 2: Fetch the full list of members with pagination
-list_uri = "at://did:plc:foo"
-did_list = []  # List to store all fetched DIDs
-cursor = None  # Start without a cursor
-
-logging.info(f"Fetching members from list: {list_uri}")
-try:
-    while True:
-        # Fetch a batch of members, including a cursor for the next page
-        params = {'list': list_uri}
-        if cursor:
-            params['cursor'] = cursor  # Add the cursor if it's set
-
-        # Fetch the response
-        response = client.app.bsky.graph.get_list(params)
-        
-        # Print response for debugging (if needed)
-        logging.debug(f"Raw response: {response}")
-        
-        # Access items and cursor directly from the response attributes
-        members = response.items if hasattr(response, 'items') else []
-        cursor = response.cursor if hasattr(response, 'cursor') else None
-
-        # Append the fetched DIDs to the list
-        did_list.extend([item.subject.did for item in members])
-        logging.debug(f"Fetched {len(members)} members. Total so far: {len(did_list)}")
-
-        # Break the loop if no more pages are available
-        if not cursor:
-            break
-
-    logging.info(f"Successfully fetched {len(did_list)} DIDs from the list.")
-except Exception as e:
-    logging.error(f"Failed to fetch list data: {e}")
-    exit(1)
-
-# Step 3: Define a reason for reporting
-reason_type = 'com.atproto.moderation.defs#reasonOther'
-reason = "Right-wing account flagged for moderation."
-
-# Step 4: Use a loop to report each DID
-logging.info("Starting the reporting process...")
-for did in did_list:
+# Bluesky account and labeler configuration
+USERNAME = config.get("BSKY_USERNAME", "bluesky username")
+PASSWORD = config.get("BSKY_PASSWORD", "application password")
+LIST_URI = config.get("REPORT_LIST_URI", "at://did:plc:foo")
+LABELER_DID = config.get("LABELER_DID", "did:plc:foo")
+
+# Reason attached to every report
+REASON_TYPE = config.get("REPORT_REASON_TYPE", "com.atproto.moderation.defs#reasonOther")
+REASON = config.get("REPORT_REASON", "Right-wing account flagged for moderation.")
+
+
+def login():
+    """Step 1: Login to Bluesky with account and app password."""
+    client = Client()
+    logging.info("Logging into Bluesky...")
+    try:
+        client.login(USERNAME, PASSWORD)
+        logging.info("Login successful.")
+    except Exception as e:
+        logging.error(f"Login failed: {e}")
+        exit(1)
+    return client
+
+
+def fetch_list_members(client, list_uri):
+    """Step 2: Fetch the full list of members with pagination."""
+    did_list = []  # List to store all fetched DIDs
+    cursor = None  # Start without a cursor
+
+    logging.info(f"Fetching members from list: {list_uri}")
     try:
-        # Prepare the report data for the current DID
-        report_data = models.ComAtprotoModerationCreateReport.Data(
-            reason_type=reason_type,
-            subject=models.ComAtprotoAdminDefs.RepoRef(
-                did=did,
-                type="com.atproto.admin.defs#repoRef"
-            ),
-            reason=reason
-        )
-        
-        # Send the report to the third-party labeler
-        response = client.with_proxy(
-            service_type='atproto_labeler', 
-            did='did:plc:foo'
-        ).com.atproto.moderation.create_report(report_data)
-        
-        # Log success
-        logging.info(f"Successfully reported {did}: {response}")
+        while True:
+            # Fetch a batch of members, including a cursor for the next page
+            params = {'list': list_uri}
+            if cursor:
+                params['cursor'] = cursor  # Add the cursor if it's set
+
+            # Fetch the response
+            response = client.app.bsky.graph.get_list(params)
+
+            # Print response for debugging (if needed)
+            logging.debug(f"Raw response: {response}")
+
+            # Access items and cursor directly from the response attributes
+            members = response.items if hasattr(response, 'items') else []
+            cursor = response.cursor if hasattr(response, 'cursor') else None
+
+            # Append the fetched DIDs to the list
+            did_list.extend([item.subject.did for item in members])
+            logging.debug(f"Fetched {len(members)} members. Total so far: {len(did_list)}")
+
+            # Break the loop if no more pages are available
+            if not cursor:
+                break
+
+        logging.info(f"Successfully fetched {len(did_list)} DIDs from the list.")
     except Exception as e:
-        # Log failure
-        logging.error(f"Failed to report {did}: {e}")
+        logging.error(f"Failed to fetch list data: {e}")
+        exit(1)
+
+    return did_list
+
+
+def create_report(client, labeler_did, did, reason_type, reason):
+    """Send one report about a DID to the labeler, raising on failure."""
+    # Prepare the report data for the current DID
+    report_data = models.ComAtprotoModerationCreateReport.Data(
+        reason_type=reason_type,
+        subject=models.ComAtprotoAdminDefs.RepoRef(
+            did=did,
+            type="com.atproto.admin.defs#repoRef"
+        ),
+        reason=reason
+    )
+
+    # Send the report to the third-party labeler
+    return client.with_proxy(
+        service_type='atproto_labeler',
+        did=labeler_did
+    ).com.atproto.moderation.create_report(report_data)
+
+
+def report_dids(client, did_list):
+    """Step 3: Report each DID to the third-party labeler, queueing failed reports for retry."""
+    logging.info("Starting the reporting process...")
+    for did in did_list:
+        payload = {"did": did, "labeler": LABELER_DID, "reason_type": REASON_TYPE, "reason": REASON}
+        try:
+            response = create_report(client, LABELER_DID, did, REASON_TYPE, REASON)
+
+            # Log success
+            logging.info(f"Successfully reported {did}: {response}")
+            retryqueue.resolve("reporter.report", payload)
+        except Exception as e:
+            # Log failure
+            logging.error(f"Failed to report {did}: {e}")
+            retryqueue.record_failure("reporter.report", payload, e)
+
+    logging.info("Reporting process completed.")
+
+
+_retry_client = None
+
+
+def retry_report(payload):
+    """Replay a failed report, logging in once per replay run."""
+    global _retry_client
+    if _retry_client is None:
+        _retry_client = login()
+    create_report(_retry_client, payload["labeler"], payload["did"], payload["reason_type"], payload["reason"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report every member of a Bluesky list to the labeler.")
+    parser.add_argument("--list", default=LIST_URI, help="AT URI of the list to report.")
+    args = parser.parse_args(argv)
+
+    client = login()
+    did_list = fetch_list_members(client, args.list)
+    report_dids(client, did_list)
+
 
-logging.info("Reporting process completed.")
+if __name__ == "__main__":
+    main()
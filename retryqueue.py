@@ -0,0 +1,272 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import config
+
+# A module logger: this is imported by the scripts, so it must not configure logging before they do
+log = logging.getLogger(__name__)
+
+# Queue configuration
+RETRY_QUEUE_PATH = config.get_path("RETRY_QUEUE_PATH", "retry_queue.sqlite")
+MAX_ATTEMPTS = config.get("RETRY_MAX_ATTEMPTS", 8)  # Attempts before an operation is dead-lettered
+BASE_DELAY = config.get("RETRY_BASE_DELAY", 60)  # Seconds before the first retry, doubled after each failure
+MAX_DELAY = config.get("RETRY_MAX_DELAY", 6 * 3600)
+REPLAY_BATCH = 100
+
+# Operation kind -> "module:function" replaying it. Handlers take the payload and raise on failure.
+# Kinds missing here (e.g. reportbot.send_report) are replayed by the script that owns them.
+HANDLERS = {
+    "autolabel.label_subject": "autolabel:retry_label_subject",
+    "autolabel.apply_label": "autolabel:retry_apply_label",
+    "autolabel.close_review": "autolabel:retry_close_review",
+    "autolabel.label_posts": "autolabel:retry_label_posts",
+    "dedupe.check_review": "dedupe:retry_check_review",
+    "dedupe.close_review": "dedupe:retry_close_review",
+    "pipeline.write_results": "pipeline:retry_write_results",
+    "pipeline.notify": "pipeline:retry_notify",
+    "reporter.report": "reporter:retry_report",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error_class TEXT,
+    error TEXT,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (kind, payload)
+);
+CREATE INDEX IF NOT EXISTS operations_due ON operations (state, next_attempt_at);
+CREATE TABLE IF NOT EXISTS failure_counts (
+    kind TEXT NOT NULL,
+    error_class TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, error_class)
+) WITHOUT ROWID;
+"""
+
+_conn = None
+_conn_pid = None
+
+
+def _connect():
+    """Return this process's connection to the queue, reconnecting after a fork."""
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        _conn = sqlite3.connect(RETRY_QUEUE_PATH, timeout=30)
+        _conn.execute("PRAGMA journal_mode = WAL;")
+        _conn.executescript(SCHEMA)
+        _conn_pid = os.getpid()
+    return _conn
+
+
+def error_class_of(error):
+    """Classify an exception for the failure counters, e.g. 'HTTP 429' or 'ConnectionError'."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return f"HTTP {status}"
+    return type(error).__name__
+
+
+def backoff(attempts):
+    """Seconds to wait before the next attempt after the given number of failures."""
+    return min(BASE_DELAY * 2 ** max(attempts - 1, 0), MAX_DELAY)
+
+
+def _fail(conn, op_id, error):
+    """Count one failed attempt: back off exponentially and dead-letter after MAX_ATTEMPTS."""
+    kind, attempts = conn.execute("SELECT kind, attempts FROM operations WHERE id = ?;", (op_id,)).fetchone()
+    attempts += 1
+    error_class = error_class_of(error)
+    state = "dead" if attempts >= MAX_ATTEMPTS else "pending"
+    conn.execute(
+        """
+        UPDATE operations
+        SET attempts = ?, state = ?, error_class = ?, error = ?, next_attempt_at = ?
+        WHERE id = ?;
+        """,
+        (attempts, state, error_class, str(error), time.time() + backoff(attempts), op_id),
+    )
+    conn.execute(
+        """
+        INSERT INTO failure_counts (kind, error_class, count) VALUES (?, ?, 1)
+        ON CONFLICT (kind, error_class) DO UPDATE SET count = count + 1;
+        """,
+        (kind, error_class),
+    )
+    conn.commit()
+    if state == "dead":
+        log.error(f"{kind} operation {op_id} dead-lettered after {attempts} attempts: {error}")
+
+
+def record_failure(kind, payload, error):
+    """Queue a failed operation for replay. Recording the same operation again counts as another attempt.
+
+    Never raises: a broken retry queue must not take down the script that is reporting the failure.
+    """
+    try:
+        conn = _connect()
+        payload_json = json.dumps(payload, sort_keys=True)
+        conn.execute(
+            """
+            INSERT INTO operations (kind, payload, next_attempt_at, created_at)
+            VALUES (?, ?, 0, ?)
+            ON CONFLICT (kind, payload) DO NOTHING;
+            """,
+            (kind, payload_json, time.time()),
+        )
+        op_id = conn.execute(
+            "SELECT id FROM operations WHERE kind = ? AND payload = ?;", (kind, payload_json)
+        ).fetchone()[0]
+        _fail(conn, op_id, error)
+        log.info(f"Queued {kind} {payload} for retry ({error_class_of(error)}).")
+    except Exception as e:
+        log.error(f"Failed to queue {kind} {payload} for retry: {e}")
+
+
+def resolve(kind, payload):
+    """Drop a queued operation because a later normal run has done the same work successfully.
+
+    Never raises, like record_failure. Nothing is created when no failure has ever been queued.
+    """
+    try:
+        if not os.path.exists(RETRY_QUEUE_PATH):
+            return
+        conn = _connect()
+        deleted = conn.execute(
+            "DELETE FROM operations WHERE kind = ? AND payload = ?;", (kind, json.dumps(payload, sort_keys=True))
+        ).rowcount
+        conn.commit()
+        if deleted:
+            log.info(f"Resolved queued {kind} {payload}.")
+    except Exception as e:
+        log.error(f"Failed to resolve queued {kind} {payload}: {e}")
+
+
+def rollback_quietly(conn):
+    """Roll back a failed transaction without raising when the connection itself is gone."""
+    if getattr(conn, "closed", False):
+        return
+    try:
+        conn.rollback()
+    except Exception as e:
+        log.error(f"Failed to roll back after error: {e}")
+
+
+def due(kinds, limit=REPLAY_BATCH):
+    """Return up to limit pending operations of the given kinds whose next attempt is due."""
+    conn = _connect()
+    placeholders = ", ".join("?" for _ in kinds)
+    rows = conn.execute(
+        f"""
+        SELECT id, kind, payload, attempts
+        FROM operations
+        WHERE state = 'pending' AND next_attempt_at <= ? AND kind IN ({placeholders})
+        ORDER BY next_attempt_at
+        LIMIT ?;
+        """,
+        (time.time(), *kinds, limit),
+    ).fetchall()
+    return [
+        {"id": op_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts}
+        for op_id, kind, payload, attempts in rows
+    ]
+
+
+def mark_done(op_id):
+    """Remove an operation that has now succeeded."""
+    conn = _connect()
+    conn.execute("DELETE FROM operations WHERE id = ?;", (op_id,))
+    conn.commit()
+
+
+def mark_failed(op_id, error):
+    """Count a failed replay of an operation returned by due()."""
+    _fail(_connect(), op_id, error)
+
+
+def replay(handlers=HANDLERS, limit=REPLAY_BATCH):
+    """Replay one batch of due operations. Returns (succeeded, failed)."""
+    succeeded = failed = 0
+    for op in due(list(handlers), limit):
+        module_name, function_name = handlers[op["kind"]].split(":")
+        handler = getattr(importlib.import_module(module_name), function_name)
+        try:
+            handler(op["payload"])
+            mark_done(op["id"])
+            succeeded += 1
+        except Exception as e:
+            log.warning(f"Retry of {op['kind']} {op['payload']} failed: {e}")
+            mark_failed(op["id"], e)
+            failed += 1
+    log.info(f"Replayed {succeeded + failed} operations: {succeeded} succeeded, {failed} failed.")
+    return succeeded, failed
+
+
+def requeue_dead(kind=None):
+    """Move dead-lettered operations back to pending with a fresh attempt budget."""
+    conn = _connect()
+    query = "UPDATE operations SET state = 'pending', attempts = 0, next_attempt_at = ? WHERE state = 'dead'"
+    params = [time.time()]
+    if kind:
+        query += " AND kind = ?"
+        params.append(kind)
+    requeued = conn.execute(query + ";", params).rowcount
+    conn.commit()
+    log.info(f"Requeued {requeued} dead operations.")
+    return requeued
+
+
+def stats():
+    """Return queue depth per kind and state, and failure counts per kind and error class."""
+    conn = _connect()
+    queue = conn.execute(
+        "SELECT kind, state, count(*) FROM operations GROUP BY kind, state ORDER BY kind, state;"
+    ).fetchall()
+    failures = conn.execute(
+        "SELECT kind, error_class, count FROM failure_counts ORDER BY count DESC;"
+    ).fetchall()
+    return queue, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay and inspect failed operations.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    replay_parser = subparsers.add_parser("replay", help="Replay due operations until none are left.")
+    replay_parser.add_argument("--batch", type=int, default=REPLAY_BATCH, help="Operations per batch.")
+    requeue_parser = subparsers.add_parser("requeue-dead", help="Give dead-lettered operations a fresh start.")
+    requeue_parser.add_argument("--kind", help="Only requeue this kind of operation.")
+    subparsers.add_parser("stats", help="Show queue depth and failure counters.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.action == "replay":
+        while True:
+            succeeded, failed = replay(limit=args.batch)
+            # Failed operations are rescheduled into the future, so a short batch means nothing is left to do
+            if succeeded + failed < args.batch:
+                break
+    elif args.action == "requeue-dead":
+        requeue_dead(args.kind)
+    else:
+        queue, failures = stats()
+        print("Queue:")
+        for kind, state, count in queue:
+            print(f"  {kind:<28}{state:<10}{count:>8}")
+        print("Failures:")
+        for kind, error_class, count in failures:
+            print(f"  {kind:<28}{error_class:<24}{count:>8}")
+
+
+if __name__ == "__main__":
+    main()
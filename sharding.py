@@ -0,0 +1,98 @@
+import argparse
+import logging
+from multiprocessing import Process
+
+# First key of every advisory lock taken here, so our locks never collide with other pg_advisory_lock users
+LOCK_NAMESPACE = 0x6F7A
+
+# Appended to an open-review query to keep only the rows that belong to one shard
+SHARD_CLAUSE = " AND mod(abs(hashtext(did)::bigint), %s) = %s"
+
+# How often (in reviews) each worker logs its progress
+PROGRESS_EVERY = 100
+
+
+def parse_shard_args(argv, description):
+    """Parse the worker/node options shared by the sharded scripts."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes to run on this host.")
+    parser.add_argument("--nodes", type=int, default=1, help="Total number of hosts sharing the queue.")
+    parser.add_argument("--node", type=int, default=0, help="Index of this host, from 0 to nodes - 1.")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.nodes < 1 or not 0 <= args.node < args.nodes:
+        parser.error("--workers and --nodes must be at least 1 and --node must be between 0 and nodes - 1")
+    return args
+
+
+def shard_query(query, shard, shards):
+    """Restrict an open-review query (ending in a WHERE clause) to one shard."""
+    if shards <= 1:
+        return query, ()
+    return query.rstrip().rstrip(";") + SHARD_CLAUSE + ";", (shards, shard)
+
+
+def claim_review(conn, record_id, did):
+    """Take the advisory lock for a subject and confirm its review is still open.
+
+    Returns True when this worker owns the subject; release it with release_subject().
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s));", (LOCK_NAMESPACE, did))
+        if not cursor.fetchone()[0]:
+            logging.debug(f"DID {did} is locked by another worker. Skipping review {record_id}.")
+            return False
+
+        query = """
+        SELECT 1
+        FROM moderation_subject_status
+        WHERE id = %s AND "reviewState" = 'tools.ozone.moderation.defs#reviewOpen';
+        """
+        cursor.execute(query, (record_id,))
+        if cursor.fetchone() is None:
+            logging.debug(f"Review {record_id} was already closed by another worker. Skipping.")
+            cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(%s));", (LOCK_NAMESPACE, did))
+            return False
+        return True
+    finally:
+        conn.commit()
+        cursor.close()
+
+
+def release_subject(conn, did):
+    """Release the advisory lock taken by claim_review()."""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(%s));", (LOCK_NAMESPACE, did))
+        conn.commit()
+        cursor.close()
+    except Exception as e:
+        logging.error(f"Failed to release advisory lock for DID {did}: {e}")
+
+
+def log_progress(shard, shards, done, total, force=False):
+    """Log a worker's progress every PROGRESS_EVERY reviews."""
+    if force or (done and done % PROGRESS_EVERY == 0):
+        logging.info(f"[shard {shard + 1}/{shards}] Processed {done}/{total} reviews.")
+
+
+def run_sharded(target, args):
+    """Run target(shard, shards) once per local worker, covering this node's slice of the shards."""
+    shards = args.workers * args.nodes
+    if shards == 1:
+        target(0, 1)
+        return
+
+    workers = []
+    for worker in range(args.workers):
+        shard = args.node * args.workers + worker
+        process = Process(target=target, args=(shard, shards), name=f"shard-{shard}")
+        process.start()
+        workers.append(process)
+    logging.info(f"Started {len(workers)} workers for {shards} shards on node {args.node}.")
+
+    for process in workers:
+        process.join()
+        if process.exitcode != 0:
+            logging.error(f"Worker {process.name} exited with code {process.exitcode}.")